@@ -1,14 +1,21 @@
 import os
-from typing import Dict, Any
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, List
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import (
+    Flask, render_template, stream_template, request, redirect, url_for, session, flash,
+    get_flashed_messages,
+)
+import numpy as np
 import pandas as pd
 
 from utils import (
     load_dataset, discover_models,
-    ensure_user_dirs, json_path_for, load_existing_annotations,
+    ensure_user_dirs, load_existing_annotations, load_progress,
     save_annotations, sanitize_username,
-    build_inline_stream, extract_tags, build_payload_inline, count_tags_in_text
+    build_inline_stream, extract_tags, build_payload_inline, count_tags_in_text,
+    resolve_tagged_texts, InlineStream,
 )
 
 # ---- Configuration ----
@@ -16,6 +23,8 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DATA_PATH = os.path.join(BASE_DIR, "data", "Final_Cues_Analysis_Dataset.xlsx")
 ANNOTATIONS_BASE = os.path.join(BASE_DIR, "annotations")
 SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "dev-secret-change-me")
+PER_PAGE = 50
+MAX_PER_PAGE = 500
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
@@ -23,6 +32,30 @@ app.secret_key = SECRET_KEY
 # Load dataset once at startup
 DF: pd.DataFrame = load_dataset(DATA_PATH)
 MODELS = discover_models(DF)
+# The dataset never changes while the app runs, so pull the columns the views
+# need into plain arrays once instead of materializing rows per request
+COL = {
+    c: DF[c].to_numpy(dtype=object) if c in DF.columns else np.full(len(DF), "", dtype=object)
+    for c in ("Title", "Stance", "Transcript No")
+}
+TAGGED = {m: resolve_tagged_texts(DF, m) for m in MODELS}
+TAG_COUNTS = {m: pd.Series(TAGGED[m]).map(count_tags_in_text).to_numpy() for m in MODELS}
+
+# Parsed tags/streams are memoized per (model, row); callers must not mutate them
+@lru_cache(maxsize=4096)
+def tags_for(model: str, row_idx: int) -> List[Dict[str, Any]]:
+    return extract_tags(TAGGED[model][row_idx]) if model else []
+
+@lru_cache(maxsize=4096)
+def stream_for(model: str, row_idx: int) -> InlineStream:
+    return build_inline_stream(TAGGED[model][row_idx] if model else "")
+
+def clamp_per_page(value) -> int:
+    try:
+        per_page = int(value)
+    except (TypeError, ValueError):
+        return PER_PAGE
+    return min(max(per_page, 1), MAX_PER_PAGE)
 
 def current_user_dir() -> str:
     username = session.get("username")
@@ -43,9 +76,10 @@ def login():
         if not name:
             flash("Please enter your name to sign in.", "error")
             return render_template("login.html")
-        session["username"] = sanitize_username(name)
-        ensure_user_dirs(ANNOTATIONS_BASE, session["username"], MODELS)
-        flash(f"Signed in as {session['username']}.")
+        username = sanitize_username(name)
+        session["username"] = username
+        ensure_user_dirs(ANNOTATIONS_BASE, username, MODELS)
+        flash(f"Signed in as {username}.")
         return redirect(url_for("index"))
     return render_template("login.html")
 
@@ -61,31 +95,43 @@ def index():
         return redirect(url_for("login"))
 
     model = request.args.get("model") or (MODELS[0] if MODELS else None)
+    model = model if model in MODELS else (MODELS[0] if MODELS else None)
     user_dir = current_user_dir()
 
-    rows = []
-    for i in range(len(DF)):
-        path = json_path_for(user_dir, model, i) if model else None
-        existing = load_existing_annotations(user_dir, model, i) if (model and os.path.exists(path)) else {}
-        df_row = DF.iloc[i]
-        tagged_text = df_row.get(model) or df_row.get("gpt4o_layer2_annotations") or df_row.get("English Translation") or ""
-        total = count_tags_in_text(tagged_text)
-        decided = sum(1 for it in existing.get("items", []) if it.get("decision") in {"agree", "disagree"}) if existing else 0
-        rows.append({
-            "idx": i,
-            "display_no": i + 1,
-            "title": df_row.get("Title", ""),
-            "stance": df_row.get("Stance", ""),
-            "progress": f"{decided}/{total}",
-        })
-
-    return render_template(
+    per_page = clamp_per_page(request.args.get("per_page"))
+    total_pages = max(1, -(-len(DF) // per_page))
+    page = min(max(request.args.get("page", 1, type=int), 1), total_pages)
+    start = (page - 1) * per_page
+    end = min(start + per_page, len(DF))
+
+    progress = load_progress(user_dir, model) if model else {}
+
+    def gen_rows():
+        for i in range(start, end):
+            total = int(TAG_COUNTS[model][i]) if model else 0
+            decided = progress.get(i, 0)
+            yield {
+                "idx": i,
+                "display_no": i + 1,
+                "title": COL["Title"][i],
+                "stance": COL["Stance"][i],
+                "progress": f"{decided}/{total}",
+            }
+
+    # Stream the table so the response starts before every row is built.
+    # Pop flashes now: the session cookie is sent before the template body renders.
+    get_flashed_messages(with_categories=True)
+    return app.response_class(stream_template(
         "index.html",
         models=MODELS,
         model=model,
-        rows=rows,
+        rows=gen_rows(),
+        total_rows=len(DF),
+        page=page,
+        per_page=per_page,
+        total_pages=total_pages,
         username=session.get("username"),
-    )
+    ))
 
 @app.route("/annotate/<int:row_idx>", methods=["GET", "POST"])
 def annotate(row_idx: int):
@@ -94,39 +140,43 @@ def annotate(row_idx: int):
 
     model = request.args.get("model") or request.form.get("model") or (MODELS[0] if MODELS else None)
     model = model if model in MODELS else (MODELS[0] if MODELS else None)
+    per_page = clamp_per_page(request.args.get("per_page") or request.form.get("per_page"))
 
-    df_row = DF.iloc[row_idx]
-    tagged_text = df_row.get(model) or df_row.get("gpt4o_layer2_annotations") or df_row.get("English Translation") or ""
+    title = COL["Title"][row_idx]
+    stance = COL["Stance"][row_idx]
 
     if request.method == "POST":
-        tags = extract_tags(tagged_text)
+        now = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        tags = tags_for(model, row_idx)
         notes = request.form.get("notes", "")
         payload = build_payload_inline(
             username=session.get("username"),
             model=model,
             row_index=row_idx,
-            transcript_no=df_row.get("Transcript No", row_idx + 1),
-            df_row=df_row,
+            transcript_no=COL["Transcript No"][row_idx],
+            title=title,
+            stance=stance,
             tags=tags,
             form_data=request.form,
             notes=notes,
+            saved_at=now,
         )
         save_annotations(current_user_dir(), model, row_idx, payload)
 
         intent = request.form.get("intent")
         if intent == "prev" and row_idx > 0:
-            return redirect(url_for("annotate", row_idx=row_idx - 1, model=model))
+            return redirect(url_for("annotate", row_idx=row_idx - 1, model=model, per_page=per_page))
         elif intent == "next" and row_idx < len(DF) - 1:
-            return redirect(url_for("annotate", row_idx=row_idx + 1, model=model))
+            return redirect(url_for("annotate", row_idx=row_idx + 1, model=model, per_page=per_page))
         elif intent == "index":
-            return redirect(url_for("index", model=model))
+            return redirect(url_for("index", model=model, page=row_idx // per_page + 1, per_page=per_page))
         elif intent == "switch_model":
             new_model = request.form.get("model") or model
-            return redirect(url_for("annotate", row_idx=row_idx, model=new_model))
-        return redirect(url_for("annotate", row_idx=row_idx, model=model))
+            return redirect(url_for("annotate", row_idx=row_idx, model=new_model, per_page=per_page))
+        return redirect(url_for("annotate", row_idx=row_idx, model=model, per_page=per_page))
 
     # GET
-    stream = build_inline_stream(tagged_text)
+    stream = stream_for(model, row_idx)
     existing = load_existing_annotations(current_user_dir(), model, row_idx)
     existing_map: Dict[int, str] = {int(item.get("tag_index")): item.get("decision") for item in existing.get("items", [])}
     notes = existing.get("notes", "")
@@ -137,14 +187,15 @@ def annotate(row_idx: int):
         "model": model,
         "row_idx": row_idx,
         "display_no": row_idx + 1,
-        "title": df_row.get("Title", ""),
-        "stance": df_row.get("Stance", ""),
-        "stream": stream,  # [{kind:'text',text:'...'} | {kind:'tag',text:'Call to Action',idx:1}]
+        "title": title,
+        "stance": stance,
+        "stream": stream,  # InlineStream(texts=[...], tags=['Call to Action', ...]); tag i has idx i+1
         "choices": existing_map,
         "notes": notes,
         "has_prev": row_idx > 0,
         "has_next": row_idx < len(DF) - 1,
         "total_rows": len(DF),
+        "per_page": per_page,
     }
 
     return render_template("annotate.html", **ctx)
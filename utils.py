@@ -1,21 +1,56 @@
 import os
-import json
 import re
-from typing import List, Dict, Any
+import threading
+import time
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 
 import pandas as pd
 import numpy as np
+import orjson
 from datetime import datetime, date
 
 # Bracketed tag like [Appeal to Authority]
+# A negated class between literal brackets cannot backtrack, so stdlib `re`
+# already scans it in linear time; a DFA engine such as RE2 gains nothing here.
 TAG_PATTERN = re.compile(r"\[([^\[\]]+)\]")
 
+_USERNAME_PATTERN = re.compile(r"[^A-Za-z0-9._-]")
+
 def sanitize_username(name: str) -> str:
-    safe = re.sub(r"[^A-Za-z0-9._-]", "_", name.strip())
+    safe = _USERNAME_PATTERN.sub("_", name.strip())
     return safe or "annotator"
 
-def load_dataset(excel_path: str) -> pd.DataFrame:
+def _read_excel_dataset(excel_path: str) -> pd.DataFrame:
     df = pd.read_excel(excel_path)
+    # Parquet needs one type per column; Excel columns often mix numbers and text.
+    # Missing cells become None, matching what pyarrow hands back for object columns.
+    for c in df.columns[df.dtypes == object]:
+        col = df[c].map(lambda v: v if v is None or isinstance(v, str) or pd.isna(v) else str(v))
+        df[c] = col.astype(object).where(col.notna(), None)
+    return df
+
+def load_dataset(excel_path: str) -> pd.DataFrame:
+    """Load the dataset, using a Parquet copy next to the Excel file when it is up to date.
+    The Parquet cache is (re)written whenever the Excel file is newer.
+    """
+    parquet_path = excel_path + ".parquet"
+    df = None
+    try:
+        if os.path.getmtime(parquet_path) >= os.path.getmtime(excel_path):
+            df = pd.read_parquet(parquet_path)
+    except Exception:
+        df = None
+    if df is None:
+        df = _read_excel_dataset(excel_path)
+        tmp = parquet_path + ".tmp"
+        try:
+            df.to_parquet(tmp, compression="zstd")
+            os.replace(tmp, parquet_path)
+            # Return exactly what later startups will load from the cache
+            df = pd.read_parquet(parquet_path)
+        except Exception:
+            # The cache is only an optimization (e.g. pyarrow missing, read-only data dir)
+            pass
     # Ensure key columns exist
     default_cols = [
         "Transcript No", "URL", "Original Text", "English Translation",
@@ -39,52 +74,48 @@ def discover_models(df: pd.DataFrame) -> List[str]:
     remaining = [c for c in candidates if c not in ordered]
     return ordered + sorted(remaining)
 
+# (base_dir, raw username) -> user dir already created in this process
+_USER_DIRS: Dict[Tuple[str, str], str] = {}
+
 def ensure_user_dirs(base_dir: str, username: str, models: List[str]) -> str:
+    """Create the user's annotation folders once per process."""
+    key = (base_dir, username)
+    if key in _USER_DIRS:
+        return _USER_DIRS[key]
     user_dir = os.path.join(base_dir, sanitize_username(username))
     os.makedirs(user_dir, exist_ok=True)
     for m in models:
         os.makedirs(os.path.join(user_dir, m), exist_ok=True)
+    _USER_DIRS[key] = user_dir
     return user_dir
 
 def json_path_for(user_dir: str, model: str, row_index: int) -> str:
     return os.path.join(user_dir, model, f"T{row_index+1}.json")
 
 # ---------- JSON helpers ----------
-def _to_jsonable(obj):
-    """Recursively convert numpy/pandas types to JSON-serializable Python types."""
-    if obj is None or isinstance(obj, (str, int, float, bool)):
-        return obj
-    # pandas specials
+def _orjson_default(obj):
+    """Convert the pandas scalars orjson does not handle natively."""
     if obj is pd.NA or obj is pd.NaT:
         return None
     if isinstance(obj, pd.Timestamp):
         return obj.isoformat()
-    # datetime
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    # numpy scalars
-    if isinstance(obj, np.integer):
-        return int(obj)
-    if isinstance(obj, np.floating):
-        return float(obj)
-    if isinstance(obj, np.bool_):
-        return bool(obj)
-    # containers
-    if isinstance(obj, dict):
-        return {str(_to_jsonable(k)): _to_jsonable(v) for k, v in obj.items()}
-    if isinstance(obj, (list, tuple, set)):
-        return [_to_jsonable(v) for v in obj]
-    # fallback
-    return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+# Annotation files are written compact; set PRETTY_ANNOTATIONS=1 to indent them for reading
+PRETTY_ANNOTATIONS = os.environ.get("PRETTY_ANNOTATIONS", "").lower() in {"1", "true", "yes", "on"}
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | (orjson.OPT_INDENT_2 if PRETTY_ANNOTATIONS else 0)
 
 def load_existing_annotations(user_dir: str, model: str, row_index: int) -> Dict[str, Any]:
     path = json_path_for(user_dir, model, row_index)
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
+    try:
+        if os.stat(path).st_size == 0:
+            return {}
+    except OSError:
         return {}
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except orjson.JSONDecodeError:
         try:
             os.replace(path, path + ".corrupt")
         except Exception:
@@ -93,14 +124,79 @@ def load_existing_annotations(user_dir: str, model: str, row_index: int) -> Dict
     except Exception:
         return {}
 
+# ---------- Durability ----------
+# Saves are atomic via os.replace; set FSYNC_ANNOTATIONS=1 to also flush them to disk.
+# The file data is synced before the rename; the directory fsyncs that make the
+# renames durable are batched by a background thread.
+FSYNC_ANNOTATIONS = os.environ.get("FSYNC_ANNOTATIONS", "").lower() in {"1", "true", "yes", "on"}
+FSYNC_INTERVAL_SECONDS = 1.0
+_pending_dir_fsync: set = set()
+_fsync_lock = threading.Lock()
+_fsync_thread: Optional[threading.Thread] = None
+
+def _fsync_path(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _fsync_worker() -> None:
+    while True:
+        time.sleep(FSYNC_INTERVAL_SECONDS)
+        with _fsync_lock:
+            dirs = list(_pending_dir_fsync)
+            _pending_dir_fsync.clear()
+        for d in dirs:
+            _fsync_path(d)
+
+def _schedule_dir_fsync(dir_path: str) -> None:
+    global _fsync_thread
+    with _fsync_lock:
+        _pending_dir_fsync.add(dir_path)
+        if _fsync_thread is None:
+            _fsync_thread = threading.Thread(target=_fsync_worker, name="annotation-fsync", daemon=True)
+            _fsync_thread.start()
+
 def save_annotations(user_dir: str, model: str, row_index: int, payload: Dict[str, Any]) -> None:
     path = json_path_for(user_dir, model, row_index)
-    safe = _to_jsonable(payload)
+    model_dir = os.path.dirname(path)
+    mtime_before = os.stat(model_dir).st_mtime_ns
     tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(safe, f, ensure_ascii=False, indent=2)
-        f.flush(); os.fsync(f.fileno())
+    data = orjson.dumps(payload, default=_orjson_default, option=_ORJSON_OPTIONS)
+    with open(tmp, "wb", buffering=64 * 1024) as f:
+        f.write(data)
+        if FSYNC_ANNOTATIONS:
+            f.flush(); os.fsync(f.fileno())
     os.replace(tmp, path)  # atomic
+    if FSYNC_ANNOTATIONS:
+        _schedule_dir_fsync(model_dir)
+    cached = _PROGRESS.get((user_dir, model))
+    if cached is not None:
+        if cached[0] == mtime_before:
+            counts = cached[1]
+            counts[row_index] = _count_decided(payload)
+            _PROGRESS[(user_dir, model)] = (os.stat(model_dir).st_mtime_ns, counts)
+        else:
+            # Someone else changed the folder since the last scan; rescan on next read
+            _PROGRESS.pop((user_dir, model), None)
+
+def _scalar(x):
+    """Coerce a pandas/numpy cell value into a plain JSON-ready Python value."""
+    if x is None or x is pd.NA or x is pd.NaT:
+        return None
+    if isinstance(x, float) and x != x:  # NaN
+        return None
+    if isinstance(x, (datetime, date)):
+        return x.isoformat()
+    if isinstance(x, np.generic):
+        return x.item()
+    return x
 
 def _safe_int(x, default=None):
     try:
@@ -108,6 +204,46 @@ def _safe_int(x, default=None):
     except Exception:
         return default
 
+# ---------- Progress cache ----------
+# (user_dir, model) -> (model dir mtime_ns, {row_index: decided tag count})
+_PROGRESS: Dict[Tuple[str, str], Tuple[int, Dict[int, int]]] = {}
+
+_DECIDED = frozenset(("agree", "disagree"))
+
+def _count_decided(payload: Dict[str, Any]) -> int:
+    items = payload.get("items") or ()
+    return sum(1 for it in items if it.get("decision") in _DECIDED)
+
+def _row_index_from_filename(name: str) -> Optional[int]:
+    if not (name.startswith("T") and name.endswith(".json")):
+        return None
+    n = _safe_int(name[1:-len(".json")])
+    return n - 1 if n else None
+
+def load_progress(user_dir: str, model: str) -> Dict[int, int]:
+    """Return {row_index: decided tag count} for a user's model folder.
+    The folder is scanned once and re-scanned only when its mtime changes. That
+    catches files created or renamed into place (as save_annotations does), but
+    not files rewritten in place.
+    """
+    model_dir = os.path.join(user_dir, model)
+    try:
+        mtime = os.stat(model_dir).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _PROGRESS.get((user_dir, model))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    counts: Dict[int, int] = {}
+    with os.scandir(model_dir) as it:
+        for entry in it:
+            row_index = _row_index_from_filename(entry.name)
+            if row_index is None or not entry.is_file():
+                continue
+            counts[row_index] = _count_decided(load_existing_annotations(user_dir, model, row_index))
+    _PROGRESS[(user_dir, model)] = (mtime, counts)
+    return counts
+
 # ---------- Inline tag extraction/rendering ----------
 def extract_tags(tagged_text: str) -> List[Dict[str, Any]]:
     """Return list of tags with their order and text.
@@ -125,27 +261,39 @@ def extract_tags(tagged_text: str) -> List[Dict[str, Any]]:
         })
     return tags
 
-def build_inline_stream(tagged_text: str) -> List[Dict[str, Any]]:
-    """Build a stream alternating between text chunks and tag chips to render inline.
-    Returns a list of dicts with shape:
-      {"kind": "text", "text": str} or {"kind": "tag", "text": tag_text, "idx": int}
+class InlineStream(NamedTuple):
+    """Text chunks and tag texts as parallel lists for inline rendering.
+    texts[i] precedes tags[i] and texts[-1] follows the last tag, so
+    len(texts) == len(tags) + 1 (chunks may be empty). Tag i has idx i + 1.
     """
+    texts: List[str]
+    tags: List[str]
+
+def build_inline_stream(tagged_text: str) -> InlineStream:
+    """Split tagged text into the text chunks between tags and the tag texts."""
     if not isinstance(tagged_text, str):
         tagged_text = ""
-    tags = extract_tags(tagged_text)
-    if not tags:
-        return [{"kind": "text", "text": tagged_text}]
-
-    stream: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    tags: List[str] = []
     last = 0
-    for t in tags:
-        if t["start"] > last:
-            stream.append({"kind": "text", "text": tagged_text[last:t["start"]]})
-        stream.append({"kind": "tag", "text": t["text"], "idx": t["idx"]})
-        last = t["end"]
-    if last < len(tagged_text):
-        stream.append({"kind": "text", "text": tagged_text[last:]})
-    return stream
+    for m in TAG_PATTERN.finditer(tagged_text):
+        texts.append(tagged_text[last:m.start()])
+        tags.append(m.group(1).strip())
+        last = m.end()
+    texts.append(tagged_text[last:])
+    return InlineStream(texts, tags)
+
+def _is_empty_cell(v) -> bool:
+    return v is None or (isinstance(v, str) and v == "") or (not isinstance(v, str) and pd.isna(v))
+
+def resolve_tagged_texts(df: pd.DataFrame, model: str) -> List[str]:
+    """Tagged text for every row of `model`, falling back to the gpt4o annotations
+    and then the English translation when the model's cell is empty."""
+    texts = []
+    for sources in zip(df[model], df["gpt4o_layer2_annotations"], df["English Translation"]):
+        text = next((v for v in sources if not _is_empty_cell(v)), "")
+        texts.append(text if isinstance(text, str) else "")
+    return texts
 
 def count_tags_in_text(tagged_text: str) -> int:
     if not isinstance(tagged_text, str):
@@ -157,10 +305,12 @@ def build_payload_inline(
     model: str,
     row_index: int,
     transcript_no: Any,
-    df_row: pd.Series,
+    title: Any,
+    stance: Any,
     tags: List[Dict[str, Any]],
     form_data: Dict[str, Any],
     notes: str,
+    saved_at: Optional[str] = None,
 ) -> Dict[str, Any]:
     items = []
     for t in tags:
@@ -176,9 +326,9 @@ def build_payload_inline(
         "model": model,
         "row_index": _safe_int(row_index, None),
         "transcript_no": _safe_int(transcript_no, None),
-        "title": df_row.get("Title", None),
-        "stance": df_row.get("Stance", None),
+        "title": _scalar(title),
+        "stance": _scalar(stance),
         "items": items,
         "notes": notes,
-        "saved_at": datetime.utcnow().isoformat() + "Z",
+        "saved_at": saved_at or datetime.utcnow().isoformat(timespec="seconds") + "Z",
     }